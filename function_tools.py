@@ -4,14 +4,70 @@
 Function Calling 工具函数库
 """
 
+import inspect
 import json
 import random
 from datetime import datetime
+from functools import lru_cache
+
+try:
+    import orjson  # 可选：更快的 JSON 解析
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# ============================================================
+# 数据加载（只读数据，进程内缓存一次）
+# ============================================================
+
+# 拼接搜索文本时的字段分隔符（不会出现在查询词中，避免跨字段误匹配）
+_SEARCH_SEP = "\x00"
+
+@lru_cache(maxsize=1)
+def _load_menu():
+    """加载餐厅菜单（首次调用时读取并缓存）"""
+    with open('restaurant_menu.json', 'rb') as f:
+        menu_data = _json_loads(f.read())
+    
+    # 按（类别, 辣度, 仅推荐）预建索引，查询时直接取对应分组；
+    # 辣度为 None 表示不限辣度。同时预先拼接可搜索文本，关键词筛选只需一次子串查找
+    index = {}
+    for cat, dishes in menu_data["菜单"].items():
+        for dish in dishes:
+            dish["_search"] = _SEARCH_SEP.join((dish["名称"], dish.get("描述", "")))
+            
+            recommend_keys = (False, True) if dish.get("推荐", False) else (False,)
+            for spicy_key in {None, dish.get("辣度")}:
+                for recommend_key in recommend_keys:
+                    index.setdefault((cat, spicy_key, recommend_key), []).append(dish)
+    
+    menu_data["_index"] = index
+    return menu_data
+
+@lru_cache(maxsize=1)
+def _load_books():
+    """加载书籍数据库（首次调用时读取并缓存）"""
+    with open('books_database.json', 'rb') as f:
+        books_data = _json_loads(f.read())
+    
+    # 预先拼接小写的可搜索文本（标题、作者、描述、关键词），
+    # 避免每次搜索重复 lower()，且每本书只需一次子串查找
+    for book in books_data["books"]:
+        fields = [book["title"], book["author"], book["description"], *book["keywords"]]
+        book["_search_l"] = _SEARCH_SEP.join(fields).lower()
+    
+    # 按评分从高到低预排序（稳定排序，同分保持原顺序），搜索时无需再排序
+    books_data["_by_rating"] = sorted(books_data["books"], key=lambda b: b["rating"], reverse=True)
+    
+    return books_data
 
 # ============================================================
 # 函数实现
 # ============================================================
 
+# 模拟天气用的随机数生成器（独立实例，不与全局 random 共享状态）
+_RNG = random.Random()
+
 def end_conversation():
     """
     结束对话
@@ -39,12 +95,12 @@ def get_weather(location="北京", date="今天"):
     weather_data = {
         "location": location,
         "date": date,
-        "condition": random.choice(weather_conditions[:4]),  # 避免极端天气
-        "temperature": random.randint(15, 30),
-        "temperature_low": random.randint(10, 20),
-        "humidity": random.randint(40, 80),
-        "wind": random.choice(["微风", "和风", "清风"]),
-        "aqi": random.randint(30, 150),
+        "condition": _RNG.choice(weather_conditions[:4]),  # 避免极端天气
+        "temperature": _RNG.randint(15, 30),
+        "temperature_low": _RNG.randint(10, 20),
+        "humidity": _RNG.randint(40, 80),
+        "wind": _RNG.choice(["微风", "和风", "清风"]),
+        "aqi": _RNG.randint(30, 150),
         "suggestion": "适合出行，记得带把伞"
     }
     
@@ -63,30 +119,40 @@ def query_menu(category=None, keyword=None, spicy_level=None, recommend_only=Fal
     返回: 菜品列表
     """
     try:
-        with open('restaurant_menu.json', 'r', encoding='utf-8') as f:
-            menu_data = json.load(f)
+        menu_data = _load_menu()
     except FileNotFoundError:
         return {"error": "菜单文件未找到"}
     
-    results = []
+    menu = menu_data["菜单"]
     
-    # 如果指定了类别
+    # 如果指定了类别（未知类别直接返回空结果）
     if category:
-        categories = [category] if category in menu_data["菜单"] else menu_data["菜单"].keys()
+        if category not in menu:
+            return {
+                "餐厅": menu_data["餐厅名称"],
+                "结果数量": 0,
+                "菜品": []
+            }
+        categories = [category]
     else:
-        categories = menu_data["菜单"].keys()
+        categories = menu.keys()
     
-    # 遍历类别
+    results = []
+    total = 0
+    index = menu_data["_index"]
+    spicy_key = spicy_level or None
+    recommend_key = bool(recommend_only)
+    
+    # 遍历类别（辣度和推荐筛选已由索引完成）
     for cat in categories:
-        for dish in menu_data["菜单"][cat]:
-            # 应用筛选条件
-            if recommend_only and not dish.get("推荐", False):
-                continue
-            
-            if spicy_level and dish.get("辣度") != spicy_level:
+        for dish in index.get((cat, spicy_key, recommend_key), ()):
+            # 应用关键词筛选
+            if keyword and keyword not in dish["_search"]:
                 continue
             
-            if keyword and keyword not in dish["名称"] and keyword not in dish.get("描述", ""):
+            # 最多返回10个，超出部分只计数不构造结果
+            total += 1
+            if total > 10:
                 continue
             
             results.append({
@@ -100,8 +166,8 @@ def query_menu(category=None, keyword=None, spicy_level=None, recommend_only=Fal
     
     return {
         "餐厅": menu_data["餐厅名称"],
-        "结果数量": len(results),
-        "菜品": results[:10]  # 最多返回10个
+        "结果数量": total,
+        "菜品": results
     }
 
 def search_books(query=None, category=None, author=None, min_rating=None):
@@ -117,14 +183,16 @@ def search_books(query=None, category=None, author=None, min_rating=None):
     返回: 书籍列表
     """
     try:
-        with open('books_database.json', 'r', encoding='utf-8') as f:
-            books_data = json.load(f)
+        books_data = _load_books()
     except FileNotFoundError:
         return {"error": "书籍数据库未找到"}
     
     results = []
+    total = 0
+    query_lower = query.lower() if query else None
     
-    for book in books_data["books"]:
+    # 按评分从高到低遍历
+    for book in books_data["_by_rating"]:
         # 应用筛选条件
         if category and book["category"] != category:
             continue
@@ -137,16 +205,15 @@ def search_books(query=None, category=None, author=None, min_rating=None):
         
         # 关键词搜索（模拟向量搜索）
         if query:
-            query_lower = query.lower()
             # 搜索标题、作者、描述、关键词
-            if not (
-                query_lower in book["title"].lower() or
-                query_lower in book["author"].lower() or
-                query_lower in book["description"].lower() or
-                any(query_lower in keyword.lower() for keyword in book["keywords"])
-            ):
+            if query_lower not in book["_search_l"]:
                 continue
         
+        # 最多返回5本，超出部分只计数不构造结果
+        total += 1
+        if total > 5:
+            continue
+        
         results.append({
             "书名": book["title"],
             "作者": book["author"],
@@ -158,12 +225,9 @@ def search_books(query=None, category=None, author=None, min_rating=None):
             "关键词": book["keywords"]
         })
     
-    # 按评分排序
-    results.sort(key=lambda x: x["评分"], reverse=True)
-    
     return {
-        "结果数量": len(results),
-        "书籍": results[:5]  # 最多返回5本
+        "结果数量": total,
+        "书籍": results
     }
 
 # ============================================================
@@ -267,6 +331,11 @@ FUNCTION_MAP = {
     "search_books": search_books
 }
 
+@lru_cache(maxsize=None)
+def _param_names(func):
+    """函数接受的参数名（每个函数只解析一次签名），调用时忽略 LLM 多传的未知参数"""
+    return frozenset(inspect.signature(func).parameters)
+
 def execute_function(function_name, arguments):
     """
     执行函数调用
@@ -277,13 +346,13 @@ def execute_function(function_name, arguments):
     
     返回: 函数执行结果
     """
-    if function_name not in FUNCTION_MAP:
+    func = FUNCTION_MAP.get(function_name)
+    if func is None:
         return {"error": f"未知函数: {function_name}"}
     
     try:
-        func = FUNCTION_MAP[function_name]
-        result = func(**arguments)
-        return result
+        params = _param_names(func)
+        return func(**{k: v for k, v in arguments.items() if k in params})
     except Exception as e:
         return {"error": f"函数执行错误: {str(e)}"}
 
@@ -14,10 +14,25 @@ from dotenv import load_dotenv
 import signal
 import sys
 import time
-import base64
 from function_tools import FUNCTION_DEFINITIONS, execute_function
 import threading
 
+try:
+    from pybase64 import b64encode, b64decode  # 可选：SIMD 加速的 base64 编解码
+except ImportError:
+    from base64 import b64encode, b64decode
+
+try:
+    import orjson  # 可选：更快的 JSON 解析
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import uvloop  # 可选：基于 libuv 的更快事件循环（不支持 Windows）
+except ImportError:
+    uvloop = None
+
 # 加载环境变量
 load_dotenv()
 
@@ -35,6 +50,7 @@ SAMPLE_RATE = 24000  # OpenAI 要求 24kHz
 CHANNELS = 1
 CHUNK_SIZE = 1024
 FORMAT = pyaudio.paInt16
+SEND_CHUNKS_PER_MESSAGE = 2  # 🎯 每条上行消息合并的音频块数（1-4），越大发送次数越少
 
 # 服务器端 VAD 参数（OpenAI 自动检测语音）
 VAD_THRESHOLD = 0.5  # 🎯 VAD 敏感度（0.0-1.0），越小越敏感
@@ -43,9 +59,56 @@ VAD_SILENCE_DURATION_MS = 500  # 🎯 静音多久后结束（毫秒），建议
 
 # TTS 参数
 TTS_VOICE = "shimmer"  # 🎯 可选: alloy, echo, fable, onyx, nova, shimmer
+PLAYBACK_VOLUME = 1.0  # 🎯 播放音量（0.0-1.0），1.0 时音频原样播放
 
 # ============================================================
 
+# input_audio_buffer.append 消息模板（信封固定，只需拼接 base64 音频，无需 json.dumps）
+AUDIO_APPEND_PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+AUDIO_APPEND_SUFFIX = b'"}'
+
+# 固定的控制消息（预先序列化，打断时无需构造字典和 json.dumps）
+CANCEL_MSG = '{"type":"response.cancel"}'
+RESPONSE_CREATE_MSG = '{"type":"response.create"}'
+
+# session.update 消息（内容完全由上面的配置决定，导入时序列化一次）
+SESSION_UPDATE_MSG = json.dumps({
+    "type": "session.update",
+    "session": {
+        "modalities": ["text", "audio"],
+        "instructions": (
+            "你是一个友好的多语言AI助手，名叫小助手。你可以：\n"
+            "1. 用户说什么语言，你就用什么语言回复\n"
+            "2. 查询天气信息\n"
+            "3. 推荐龙凤楼中餐厅的美食\n"
+            "4. 搜索和推荐书籍\n"
+            "5. 当用户明确表示要结束对话时，调用 end_conversation 函数\n\n"
+            "回复风格：简洁、自然、友好。使用 function calling 来处理具体查询。"
+        ),
+        "voice": TTS_VOICE,
+        "input_audio_format": "pcm16",
+        "output_audio_format": "pcm16",
+        "input_audio_transcription": {
+            "model": "whisper-1"
+        },
+        "turn_detection": {  # 🎯 启用服务器端 VAD（自动检测说话）
+            "type": "server_vad",
+            "threshold": VAD_THRESHOLD,
+            "prefix_padding_ms": VAD_PREFIX_PADDING_MS,
+            "silence_duration_ms": VAD_SILENCE_DURATION_MS
+        },
+        "tools": FUNCTION_DEFINITIONS  # 🎯 添加 function calling
+    }
+})
+
+def scale_volume(audio_data, volume):
+    """调整 PCM16 音频音量（volume 为 1.0 时原样返回，不做任何拷贝）"""
+    if volume == 1.0:
+        return audio_data
+    # frombuffer 零拷贝得到 int16 视图，向量化缩放后再转回字节
+    samples = np.frombuffer(audio_data, dtype=np.int16)
+    return np.clip(samples * volume, -32768, 32767).astype(np.int16).tobytes()
+
 class RealtimeClient:
     def __init__(self):
         self.ws = None
@@ -57,8 +120,19 @@ class RealtimeClient:
         self.session_id = None
         
         # 打断控制
-        self.interrupt_flag = False
+        self.interrupt_event = asyncio.Event()  # 键盘线程触发，无需轮询
         self.drop_audio_until_cancelled = False  # 丢弃音频帧标志
+        
+        # 上行音频消息缓冲区（每帧原地覆盖 base64 部分，避免中间对象分配）
+        self._frame_buf = bytearray(AUDIO_APPEND_PREFIX + AUDIO_APPEND_SUFFIX)
+        
+        # 麦克风采集队列（PortAudio 回调线程 -> 事件循环）
+        self._loop = None
+        self._capture_q = None
+        
+        # 待发送的音频（累积多个块后合并发送）
+        self._pending_audio = bytearray()
+        self._send_batch_bytes = CHUNK_SIZE * 2 * SEND_CHUNKS_PER_MESSAGE  # 16-bit 单声道
     
     async def connect(self):
         """连接到 OpenAI Realtime API"""
@@ -70,83 +144,85 @@ class RealtimeClient:
         url = f"{REALTIME_API_URL}?model={MODEL}"
         
         print("🔄 正在连接到 OpenAI Realtime API...")
-        self.ws = await websockets.connect(url, extra_headers=headers)
+        self.ws = await websockets.connect(
+            url,
+            extra_headers=headers,
+            compression=None,  # base64 音频几乎无法压缩，关闭 permessage-deflate 省去每帧 zlib
+            max_size=2**23,  # 允许较大的单条消息（8MB）
+            read_limit=2**20,
+            write_limit=2**20
+        )
         print("✅ 已连接到 OpenAI Realtime API")
         
         await self.configure_session()
         
     async def configure_session(self):
         """配置会话参数"""
-        config = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["text", "audio"],
-                "instructions": (
-                    "你是一个友好的多语言AI助手，名叫小助手。你可以：\n"
-                    "1. 用户说什么语言，你就用什么语言回复\n"
-                    "2. 查询天气信息\n"
-                    "3. 推荐龙凤楼中餐厅的美食\n"
-                    "4. 搜索和推荐书籍\n"
-                    "5. 当用户明确表示要结束对话时，调用 end_conversation 函数\n\n"
-                    "回复风格：简洁、自然、友好。使用 function calling 来处理具体查询。"
-                ),
-                "voice": TTS_VOICE,
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "input_audio_transcription": {
-                    "model": "whisper-1"
-                },
-                "turn_detection": {  # 🎯 启用服务器端 VAD（自动检测说话）
-                    "type": "server_vad",
-                    "threshold": VAD_THRESHOLD,
-                    "prefix_padding_ms": VAD_PREFIX_PADDING_MS,
-                    "silence_duration_ms": VAD_SILENCE_DURATION_MS
-                },
-                "tools": FUNCTION_DEFINITIONS  # 🎯 添加 function calling
-            }
-        }
-        
-        await self.ws.send(json.dumps(config))
+        await self.ws.send(SESSION_UPDATE_MSG)
         print(f"⚙️  会话配置已发送（TTS: {TTS_VOICE}，Server VAD 已启用，Functions: {len(FUNCTION_DEFINITIONS)}个）")
         
     async def start_audio_input(self):
         """启动麦克风输入并流式发送到 OpenAI"""
+        self._loop = asyncio.get_running_loop()
+        self._capture_q = asyncio.Queue(maxsize=32)  # 约 1.4 秒音频
+        
+        # 回调模式：PortAudio 在自己的线程中交付音频，无需每块切换线程读取
         self.input_stream = self.audio.open(
             format=FORMAT,
             channels=CHANNELS,
             rate=SAMPLE_RATE,
             input=True,
-            frames_per_buffer=CHUNK_SIZE
+            frames_per_buffer=CHUNK_SIZE,
+            stream_callback=self._on_capture,
+            start=False
         )
+        self.input_stream.start_stream()
         
         print("🎙️  麦克风已启动，直接流式传输到 OpenAI（Server VAD 自动检测）...")
         
         while self.is_running:
             try:
                 # 读取音频
-                audio_data = await asyncio.to_thread(
-                    self.input_stream.read, CHUNK_SIZE, False
-                )
+                audio_data = await self._capture_q.get()
                 
                 # 🎯 直接发送音频流到 OpenAI（不做本地处理）
+                pending = self._pending_audio
                 if not self.is_ai_speaking:
-                    # Base64 编码
-                    audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-                    
-                    # 发送音频帧
-                    audio_msg = {
-                        "type": "input_audio_buffer.append",
-                        "audio": audio_b64
-                    }
-                    await self.ws.send(json.dumps(audio_msg))
-                
-                await asyncio.sleep(0.001)
+                    # 累积到批量大小再发送，减少编码和 WebSocket 发送次数
+                    pending += audio_data
+                    if len(pending) >= self._send_batch_bytes:
+                        await self._send_audio(pending)
+                        pending.clear()
+                elif pending:
+                    # AI 开始说话，发出剩余的音频
+                    await self._send_audio(pending)
+                    pending.clear()
                 
             except Exception as e:
                 if self.is_running:
                     print(f"❌ 音频输入错误: {e}")
                 break
     
+    def _on_capture(self, in_data, frame_count, time_info, status):
+        """麦克风采集回调（在 PortAudio 线程中运行）"""
+        self._loop.call_soon_threadsafe(self._enqueue_capture, in_data)
+        return (None, pyaudio.paContinue)
+    
+    def _enqueue_capture(self, audio_data):
+        """把采集到的音频放入队列（队列满时丢弃最旧的一块）"""
+        if self._capture_q.full():
+            self._capture_q.get_nowait()
+        self._capture_q.put_nowait(audio_data)
+    
+    async def _send_audio(self, audio_data):
+        """发送一条 input_audio_buffer.append 消息"""
+        # Base64 编码后写入消息缓冲区（base64 只含 ASCII 字符，无需 JSON 转义）
+        frame = self._frame_buf
+        frame[len(AUDIO_APPEND_PREFIX):len(frame) - len(AUDIO_APPEND_SUFFIX)] = b64encode(audio_data)
+        
+        # 以文本帧发送（websockets 会把 bytes 作为二进制帧发送）
+        await self.ws.send(frame.decode('ascii'))
+    
     async def _send_function_result(self, call_id, result):
         """发送函数执行结果给 OpenAI"""
         # 重置音频丢弃标志，准备接收新的响应
@@ -163,10 +239,7 @@ class RealtimeClient:
         await self.ws.send(json.dumps(message))
         
         # 请求 AI 继续响应
-        response_msg = {
-            "type": "response.create"
-        }
-        await self.ws.send(json.dumps(response_msg))
+        await self.ws.send(RESPONSE_CREATE_MSG)
         
     async def start_audio_output(self):
         """启动音频输出"""
@@ -182,12 +255,14 @@ class RealtimeClient:
     
     async def keyboard_listener(self):
         """监听键盘输入（按回车打断）"""
+        loop = asyncio.get_running_loop()
+        
         def listen_keyboard():
             while self.is_running:
                 try:
                     input()  # 等待回车键
                     if self.is_ai_speaking:
-                        self.interrupt_flag = True
+                        loop.call_soon_threadsafe(self.interrupt_event.set)
                 except:
                     break
         
@@ -195,49 +270,47 @@ class RealtimeClient:
         thread = threading.Thread(target=listen_keyboard, daemon=True)
         thread.start()
         
-        # 检查打断标志
+        # 等待打断事件（空闲时不唤醒事件循环）
         while self.is_running:
-            if self.interrupt_flag:
-                print("\n⚡ 检测到打断（回车键），立即停止播放")
-                
-                # 🎯 1. 立即设置标志，丢弃后续音频帧（不等服务器确认）
-                self.drop_audio_until_cancelled = True
-                self.is_ai_speaking = False
-                
-                # 🎯 2. 立即清空音频缓冲区并重启流
-                if self.output_stream:
-                    try:
-                        self.output_stream.stop_stream()
-                        self.output_stream.close()
-                        
-                        # 重新创建音频流（彻底清空缓冲区）
-                        self.output_stream = self.audio.open(
-                            format=FORMAT,
-                            channels=CHANNELS,
-                            rate=SAMPLE_RATE,
-                            output=True,
-                            frames_per_buffer=4800
-                        )
-                        print("🔇 音频缓冲区已清空")
-                    except Exception as e:
-                        print(f"⚠️  重置音频流: {e}")
-                
-                # 🎯 3. 异步发送取消消息到服务器（不阻塞）
+            await self.interrupt_event.wait()
+            self.interrupt_event.clear()
+            if not self.is_running:
+                break
+            
+            print("\n⚡ 检测到打断（回车键），立即停止播放")
+            
+            # 🎯 1. 立即设置标志，丢弃后续音频帧（不等服务器确认）
+            self.drop_audio_until_cancelled = True
+            self.is_ai_speaking = False
+            
+            # 🎯 2. 立即清空音频缓冲区并重启流
+            if self.output_stream:
                 try:
-                    cancel_msg = {
-                        "type": "response.cancel"
-                    }
-                    await self.ws.send(json.dumps(cancel_msg))
-                    print("📤 已发送取消请求到服务器（等待确认）")
+                    self.output_stream.stop_stream()
+                    self.output_stream.close()
+                    
+                    # 重新创建音频流（彻底清空缓冲区）
+                    self.output_stream = self.audio.open(
+                        format=FORMAT,
+                        channels=CHANNELS,
+                        rate=SAMPLE_RATE,
+                        output=True,
+                        frames_per_buffer=4800
+                    )
+                    print("🔇 音频缓冲区已清空")
                 except Exception as e:
-                    print(f"❌ 发送取消请求失败: {e}")
-                    # 即使发送失败，本地也已经停止了
-                    self.drop_audio_until_cancelled = False
-                
-                self.interrupt_flag = False
-                print("🎙️  已恢复监听，可以继续说话...")
+                    print(f"⚠️  重置音频流: {e}")
             
-            await asyncio.sleep(0.05)  # 更快的检查频率（50ms）
+            # 🎯 3. 异步发送取消消息到服务器（不阻塞）
+            try:
+                await self.ws.send(CANCEL_MSG)
+                print("📤 已发送取消请求到服务器（等待确认）")
+            except Exception as e:
+                print(f"❌ 发送取消请求失败: {e}")
+                # 即使发送失败，本地也已经停止了
+                self.drop_audio_until_cancelled = False
+            
+            print("🎙️  已恢复监听，可以继续说话...")
         
     async def handle_messages(self):
         """处理来自服务器的消息"""
@@ -245,7 +318,11 @@ class RealtimeClient:
         
         try:
             async for message in self.ws:
-                data = json.loads(message)
+                # 🎯 等待取消确认期间，音频帧不解析直接丢弃（只检查消息开头的事件类型）
+                if self.drop_audio_until_cancelled and '"response.audio.delta"' in message[:64]:
+                    continue
+                
+                data = _json_loads(message)
                 event_type = data.get("type")
                 
                 if event_type == "session.created":
@@ -346,9 +423,9 @@ class RealtimeClient:
                     self.is_ai_speaking = True
                     audio_b64 = data.get("delta", "")
                     if audio_b64 and self.output_stream:
-                        audio_data = base64.b64decode(audio_b64)
+                        audio_data = b64decode(audio_b64)
                         try:
-                            self.output_stream.write(audio_data)
+                            self.output_stream.write(scale_volume(audio_data, PLAYBACK_VOLUME))
                         except Exception as e:
                             print(f"⚠️  音频播放错误: {e}")
                 
@@ -392,6 +469,7 @@ class RealtimeClient:
                             await self._send_function_result(call_id, result)
                             await asyncio.sleep(3)
                             self.is_running = False
+                            self.interrupt_event.set()  # 唤醒键盘监听协程以便退出
                             return
                         
                         await self._send_function_result(call_id, result)
@@ -509,5 +587,8 @@ async def main():
     await client.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
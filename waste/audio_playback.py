@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回调模式音频播放工具（realtime_client / realtime_local_asr_backup 共用）
+- PolyphaseResampler: 流式多相重采样，把 AI 音频转换到声卡原生采样率
+- PlaybackBuffer: 事件循环与 PortAudio 输出回调之间的播放缓冲
+"""
+
+from collections import deque
+import math
+
+import numpy as np
+import pyaudio
+
+class PolyphaseResampler:
+    """
+    流式多相重采样器（16-bit PCM，单声道）
+    按 up/down 有理比例重采样，FIR 抽头按相位预先拆分，块与块之间保留历史样本，
+    逐块处理也不会在块边界产生爆音
+    """
+    
+    TAPS_PER_PHASE = 32  # 每个相位的抽头数（越大越接近理想低通，计算量越高）
+    
+    def __init__(self, src_rate, dst_rate):
+        g = math.gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.passthrough = self.up == self.down
+        
+        taps = self.TAPS_PER_PHASE
+        n = self.up * taps
+        
+        # Kaiser 窗 sinc 低通，截止频率取两侧较低奈奎斯特频率的 90%（相对上采样后的采样率）
+        cutoff = 0.9 * 0.5 / max(self.up, self.down)
+        t = np.arange(n) - (n - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, 8.0) * self.up
+        
+        # 拆成多相：_phases[p, j] = h[p + j*up]
+        self._phases = h.reshape(taps, self.up).T.astype(np.float32)
+        self._tap_offsets = np.arange(taps - 1, -1, -1)
+        self.reset()
+    
+    def reset(self):
+        """清空历史（打断后重新开始播放时调用）"""
+        self._history = np.zeros(self.TAPS_PER_PHASE - 1, dtype=np.float32)
+        self._t = 0  # 下一个输出样本在上采样域中相对当前块起点的位置
+    
+    def process(self, audio_data):
+        """重采样一块音频（bytes 或 bytearray），返回新的 16-bit PCM 字节"""
+        if self.passthrough:
+            return bytes(audio_data)
+        
+        samples = np.frombuffer(audio_data, dtype='<i2')
+        x = np.concatenate((self._history, samples.astype(np.float32)))
+        span = samples.size * self.up
+        
+        count = max(0, -(-(span - self._t) // self.down))
+        ts = self._t + self.down * np.arange(count)
+        n, p = np.divmod(ts, self.up)
+        
+        # 每个输出样本 = 对应相位的抽头 · 最近 TAPS_PER_PHASE 个输入样本
+        windows = x[n[:, None] + self._tap_offsets[None, :]]
+        out = np.einsum('ij,ij->i', windows, self._phases[p])
+        
+        self._t += count * self.down - span
+        self._history = x[x.size - (self.TAPS_PER_PHASE - 1):]
+        
+        return np.clip(np.rint(out), -32768, 32767).astype('<i2').tobytes()
+
+
+class PlaybackBuffer:
+    """
+    回调模式播放缓冲（事件循环 -> PortAudio 回调线程）
+    事件循环侧把连续到达的音频增量合并、重采样后放入队列；
+    输出回调侧按需取出，不足时补静音。deque 的两端操作是线程安全的
+    """
+    
+    def __init__(self, src_rate, dst_rate, coalesce_bytes, channels=1):
+        self.resampler = PolyphaseResampler(src_rate, dst_rate)
+        self.coalesce_bytes = coalesce_bytes  # 音频增量最多合并多少字节再放入队列
+        self._bytes_per_frame = channels * 2  # 16-bit PCM
+        self._pending = bytearray()  # 尚未放入队列的音频增量
+        self._ring = deque()  # 已重采样、等待回调取走的音频块
+        self._rest = b''  # 上一次回调未用完的音频
+        self._flush_flag = False  # 打断时通知回调丢弃残留音频
+    
+    def write(self, audio_data):
+        """追加一段音频增量；攒够一批，或队列已被取空（再攒就会断音）时放入队列"""
+        self._pending += audio_data
+        if len(self._pending) >= self.coalesce_bytes or not self._ring:
+            self.flush()
+    
+    def flush(self):
+        """把攒下的音频增量重采样后整块放入队列"""
+        if self._pending:
+            # 重采样直接读取 bytearray 并返回新的字节，无需先拷贝一份
+            self._ring.append(self.resampler.process(self._pending))
+            self._pending.clear()
+    
+    def clear(self):
+        """丢弃所有待播放的音频（打断时调用）"""
+        self._pending.clear()
+        self._ring.clear()
+        self._flush_flag = True
+        self.resampler.reset()
+    
+    def is_playing(self):
+        """是否还有待播放的音频"""
+        return bool(self._pending) or bool(self._ring) or bool(self._rest)
+    
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio 输出回调（在 PortAudio 线程中运行）"""
+        need = frame_count * self._bytes_per_frame
+        
+        if self._flush_flag:
+            self._rest = b''
+            self._flush_flag = False
+        
+        buf = self._rest
+        while len(buf) < need:
+            try:
+                buf += self._ring.popleft()
+            except IndexError:
+                break
+        
+        if len(buf) >= need:
+            out, self._rest = buf[:need], buf[need:]
+        else:
+            out, self._rest = buf + bytes(need - len(buf)), b''
+        return (out, pyaudio.paContinue)
@@ -8,13 +8,34 @@ import asyncio
 import websockets
 import json
 import pyaudio
-import base64
+from binascii import a2b_base64, b2a_base64
 import os
 from dotenv import load_dotenv
 import signal
 import sys
-import struct
 import math
+import numpy as np
+from audio_playback import PlaybackBuffer
+
+try:
+    import orjson  # 可选：更快的 JSON 解析/序列化
+    _json_loads = orjson.loads
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+try:
+    import uvloop  # 可选：基于 libuv 的更快事件循环（不支持 Windows）
+except ImportError:
+    uvloop = None
+
+try:
+    from numba import njit  # 可选：JIT 编译音频预处理内核
+except ImportError:
+    njit = None
 
 # 加载环境变量
 load_dotenv()
@@ -28,8 +49,16 @@ MODEL = "gpt-4o-realtime-preview-2024-10-01"
 SAMPLE_RATE = 24000  # 24kHz
 CHANNELS = 1  # 单声道（OpenAI 要求）
 CHUNK_SIZE = 4800  # 200ms 的音频块 (24000 * 0.2)
+CAPTURE_FRAMES = 480  # 麦克风每次回调的帧数（20ms），小帧让打断检测更及时
 FORMAT = pyaudio.paInt16  # 16-bit PCM
 
+# 发送批量参数
+SEND_BATCH_MS = 400  # 累积多少毫秒的音频再合并成一条消息发送（减少每帧开销，增加少量延迟）
+SEND_BATCH_BYTES = SAMPLE_RATE * SEND_BATCH_MS // 1000 * 2  # 16-bit 单声道
+
+# 播放合并参数：小的音频增量先攒到这么多字节再交给播放队列（播放队列空时立即交付）
+PLAYBACK_FLUSH_BYTES = CHUNK_SIZE * 2
+
 # 回音消除参数
 INTERRUPT_THRESHOLD = 0  # 打断阈值（音频能量），越大越不容易触发打断
 ENABLE_ECHO_CANCELLATION = False  # 是否启用回音消除（AI播放时不发送麦克风数据）
@@ -43,46 +72,170 @@ TARGET_GAIN = 1  # 目标增益倍数（建议 1.0-3.0）
 ENABLE_NOISE_GATE = False  # 是否启用噪声门（过滤低能量噪音）
 NOISE_GATE_THRESHOLD = 30  # 噪声门阈值，低于此值的音频会被静音
 
+def _gain_q8(gain):
+    """
+    增益能精确表示为 Q8 定点数（增益 × 256 为整数，如 1.0、1.5、2.25）时返回定点值，否则返回 0
+    非精确的增益（如 1.3）量化后误差随振幅增大，这种情况走浮点乘法
+    """
+    scaled = gain * 256
+    return int(scaled) if float(scaled).is_integer() else 0
+
+# 定点增益（Q8），为 0 时使用浮点增益
+GAIN_Q = _gain_q8(TARGET_GAIN)
+
+# 会话配置消息（固定内容，模块加载时序列化一次）
+SESSION_UPDATE_MSG = _json_dumps({
+    "type": "session.update",
+    "session": {
+        "modalities": ["text", "audio"],
+        "instructions": (
+            "你是一个友好的多语言AI助手。请遵循以下规则：\n"
+            "1. 自动检测用户使用的语言\n"
+            "2. 用户说什么语言，你就用什么语言回复\n"
+            "3. 如果用户说中文，你就用中文回复\n"
+            "4. 如果用户说英语，你就用英语回复\n"
+            "5. 如果用户说日语，你就用日语回复\n"
+            "6. 保持简洁、自然的对话风格\n"
+            "7. 不要混用多种语言，始终使用用户当前使用的语言"
+        ),
+        "voice": "shimmer",  # shimmer 声音（女声，温暖友好）
+        "input_audio_format": "pcm16",
+        "output_audio_format": "pcm16",
+        "input_audio_transcription": {
+            "model": "whisper-1"
+        },
+        "turn_detection": {
+            "type": "server_vad",  # 服务器端语音活动检测
+            "threshold": 0.5,
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 500  # 500ms 静音后结束
+        }
+    }
+})
+
 def calculate_audio_energy(audio_data):
     """计算音频能量（RMS - Root Mean Square）"""
-    # 将字节数据转换为 16-bit 整数
-    samples = struct.unpack(f'{len(audio_data)//2}h', audio_data)
+    # 将字节数据零拷贝视为 16-bit 整数，转 int64 后累加平方和（避免溢出）
+    samples = np.frombuffer(audio_data, dtype='<i2').astype(np.int64)
+    if samples.size == 0:
+        return 0
     # 计算 RMS
-    sum_squares = sum(sample ** 2 for sample in samples)
-    rms = math.sqrt(sum_squares / len(samples))
+    rms = math.sqrt(np.dot(samples, samples) / samples.size)
     return int(rms)
 
+def audio_above_threshold(audio_data, threshold):
+    """判断音频 RMS 能量是否超过阈值（比较平方和，不开方、不做除法）"""
+    samples = np.frombuffer(audio_data, dtype='<i2').astype(np.int64)
+    return int(np.dot(samples, samples)) > threshold * threshold * samples.size
+
 def apply_gain(audio_data, gain=1.5):
     """应用增益（放大音频）"""
-    samples = struct.unpack(f'{len(audio_data)//2}h', audio_data)
-    # 应用增益并限制在 int16 范围内
-    amplified = [max(-32768, min(32767, int(sample * gain))) for sample in samples]
-    return struct.pack(f'{len(amplified)}h', *amplified)
+    samples = np.frombuffer(audio_data, dtype='<i2')
+    gain_q = _gain_q8(gain)
+    if gain_q:
+        # 定点乘法；负数先加 255 再右移，与浮点结果一样向零取整
+        v = samples.astype(np.int32) * gain_q
+        amplified = (v + ((v >> 31) & 255)) >> 8
+    else:
+        amplified = samples.astype(np.int32) * gain
+    # 限制在 int16 范围内
+    amplified = np.clip(amplified, -32768, 32767)
+    return amplified.astype('<i2').tobytes()
+
+# 常见帧长的静音（只读，复用，避免噪声门每帧分配）
+_SILENCE_FRAME = bytes(CAPTURE_FRAMES * 2)
+
+def _silence(nbytes):
+    """返回指定长度的静音字节"""
+    return _SILENCE_FRAME if nbytes == len(_SILENCE_FRAME) else bytes(nbytes)
 
 def apply_noise_gate(audio_data, threshold=30):
     """应用噪声门（过滤低能量音频）"""
     energy = calculate_audio_energy(audio_data)
     if energy < threshold:
         # 返回静音
-        return b'\x00' * len(audio_data)
+        return _silence(len(audio_data))
     return audio_data
 
-def preprocess_audio(audio_data):
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _preprocess_kernel(samples, out, gain_q, gain, gate_threshold, enable_gate, enable_gain):
+        """
+        噪声门 + 增益融合内核：先累加平方和判断噪声门，再一趟完成增益和限幅
+        被噪声门静音时返回 True（此时不写 out）
+        """
+        n = samples.shape[0]
+        if enable_gate:
+            total = np.int64(0)
+            for i in range(n):
+                v = np.int64(samples[i])
+                total += v * v
+            if n == 0 or int(math.sqrt(total / n)) < gate_threshold:
+                return True
+        for i in range(n):
+            if enable_gain:
+                if gain_q:
+                    v = np.int32(samples[i]) * gain_q
+                    v = (v + ((v >> 31) & 255)) >> 8  # 向零取整
+                else:
+                    v = int(samples[i] * gain)
+                out[i] = max(-32768, min(32767, v))
+            else:
+                out[i] = samples[i]
+        return False
+
+# 预处理输出缓冲区（复用，避免每帧分配）
+_preprocess_out = np.empty(CHUNK_SIZE, dtype='<i2')
+
+def _build_pipeline(enable_gate, enable_gain):
     """
-    音频预处理主函数
-    包括：噪声门、增益控制等
+    根据开关组合生成专用的音频预处理函数
+    启动时确定一次，热路径中不再判断开关
     """
-    processed = audio_data
+    # 都关闭时原样返回
+    if not (enable_gate or enable_gain):
+        def passthrough(audio_data):
+            return audio_data
+        return passthrough
+    
+    # 🚀 有 Numba 时用融合内核一次完成
+    if njit is not None:
+        def fused(audio_data):
+            samples = np.frombuffer(audio_data, dtype='<i2')
+            if samples.size <= _preprocess_out.size:
+                out = _preprocess_out[:samples.size]
+            else:
+                out = np.empty_like(samples)
+            if _preprocess_kernel(samples, out, GAIN_Q, float(TARGET_GAIN), NOISE_GATE_THRESHOLD,
+                                  enable_gate, enable_gain):
+                return _silence(len(audio_data))
+            return out.tobytes()
+        return fused
     
-    # 1. 噪声门（过滤环境噪音）
-    if ENABLE_NOISE_GATE:
-        processed = apply_noise_gate(processed, NOISE_GATE_THRESHOLD)
+    # 1. 噪声门（过滤环境噪音） 2. 增益控制（增强音量）
+    if enable_gate and enable_gain:
+        def gate_and_gain(audio_data):
+            # 被噪声门静音的帧无需再做增益
+            if calculate_audio_energy(audio_data) < NOISE_GATE_THRESHOLD:
+                return _silence(len(audio_data))
+            return apply_gain(audio_data, TARGET_GAIN)
+        return gate_and_gain
     
-    # 2. 增益控制（增强音量）
-    if ENABLE_GAIN_CONTROL:
-        processed = apply_gain(processed, TARGET_GAIN)
+    if enable_gate:
+        def gate_only(audio_data):
+            return apply_noise_gate(audio_data, NOISE_GATE_THRESHOLD)
+        return gate_only
     
-    return processed
+    def gain_only(audio_data):
+        return apply_gain(audio_data, TARGET_GAIN)
+    return gain_only
+
+# 音频预处理主函数（包括：噪声门、增益控制等）
+preprocess_audio = _build_pipeline(ENABLE_NOISE_GATE, ENABLE_GAIN_CONTROL)
+
+def warmup_preprocess():
+    """预热 JIT 编译，避免第一帧音频因编译而卡顿"""
+    preprocess_audio(bytes(CHUNK_SIZE * 2))
 
 class RealtimeClient:
     def __init__(self):
@@ -95,6 +248,42 @@ class RealtimeClient:
         self.session_id = None
         self.cancel_sent = False  # 防止重复发送取消消息
         
+        # 音频追加消息的固定头尾（base64 只含 ASCII，无需再经过 json 序列化）
+        # Realtime API 只接受 JSON 文本帧里的 base64 音频，不支持二进制帧，编码无法省去
+        self._audio_prefix = b'{"type":"input_audio_buffer.append","audio":"'
+        self._audio_suffix = b'"}'
+        # 复用的消息缓冲区：每次只替换中间的 base64 部分
+        self._frame_buf = bytearray(self._audio_prefix + self._audio_suffix)
+        
+        # 麦克风采集队列（回调线程 -> 事件循环）
+        self._loop = None
+        self._capture_q = None
+        
+        # 待发送的音频（累积后合并发送）
+        self._send_buf = bytearray()
+        self._last_flush = 0.0
+        self._send_q = None  # 发送队列（输入协程 -> 写协程）
+        
+        # 播放队列（事件循环 -> 输出回调线程）
+        self._player = None  # 播放缓冲（含重采样到声卡原生采样率），启动输出时创建
+        
+        # 服务器事件分发表（事件类型 -> 处理方法）
+        self._handlers = {
+            "response.audio.delta": self._handle_audio_delta,
+            "response.audio.done": self._handle_audio_done,
+            "response.text.delta": self._handle_text_delta,
+            "response.text.done": self._handle_text_done,
+            "session.created": self._handle_session_created,
+            "session.updated": self._handle_session_updated,
+            "input_audio_buffer.committed": self._handle_audio_committed,
+            "conversation.item.created": self._handle_item_created,
+            "response.created": self._handle_response_created,
+            "response.done": self._handle_response_done,
+            "conversation.item.input_audio_transcription.completed": self._handle_transcription,
+            "response.cancelled": self._handle_response_cancelled,
+            "error": self._handle_error,
+        }
+        
     async def connect(self):
         """连接到 OpenAI Realtime API"""
         headers = {
@@ -105,7 +294,14 @@ class RealtimeClient:
         url = f"{REALTIME_API_URL}?model={MODEL}"
         
         print("🔄 正在连接到 OpenAI Realtime API...")
-        self.ws = await websockets.connect(url, extra_headers=headers)
+        self.ws = await websockets.connect(
+            url,
+            extra_headers=headers,
+            compression=None,  # base64 音频几乎无法压缩，关闭 permessage-deflate 省去每帧 zlib
+            max_size=2**23,  # 允许较大的单条消息（8MB）
+            read_limit=2**20,
+            write_limit=2**20
+        )
         print("✅ 已连接到 OpenAI Realtime API")
         
         # 配置会话
@@ -113,208 +309,236 @@ class RealtimeClient:
         
     async def configure_session(self):
         """配置会话参数"""
-        config = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["text", "audio"],
-                "instructions": (
-                    "你是一个友好的多语言AI助手。请遵循以下规则：\n"
-                    "1. 自动检测用户使用的语言\n"
-                    "2. 用户说什么语言，你就用什么语言回复\n"
-                    "3. 如果用户说中文，你就用中文回复\n"
-                    "4. 如果用户说英语，你就用英语回复\n"
-                    "5. 如果用户说日语，你就用日语回复\n"
-                    "6. 保持简洁、自然的对话风格\n"
-                    "7. 不要混用多种语言，始终使用用户当前使用的语言"
-                ),
-                "voice": "shimmer",  # shimmer 声音（女声，温暖友好）
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "input_audio_transcription": {
-                    "model": "whisper-1"
-                },
-                "turn_detection": {
-                    "type": "server_vad",  # 服务器端语音活动检测
-                    "threshold": 0.5,
-                    "prefix_padding_ms": 300,
-                    "silence_duration_ms": 500  # 500ms 静音后结束
-                }
-            }
-        }
-        
-        await self.ws.send(json.dumps(config))
+        await self.ws.send(SESSION_UPDATE_MSG)
         print("⚙️  会话配置已发送（多语言模式 + shimmer 声音）")
         
     async def start_audio_input(self):
         """启动麦克风音频输入"""
+        self._loop = asyncio.get_running_loop()
+        self._capture_q = asyncio.Queue(maxsize=150)  # 约 3 秒音频
+        
+        # 回调模式：PortAudio 在自己的线程中交付音频，无需每块切换线程读取
         self.input_stream = self.audio.open(
             format=FORMAT,
             channels=CHANNELS,
             rate=SAMPLE_RATE,
             input=True,
-            frames_per_buffer=CHUNK_SIZE
+            frames_per_buffer=CAPTURE_FRAMES,
+            stream_callback=self._on_capture,
+            start=False
         )
+        self.input_stream.start_stream()
+        self._last_flush = self._loop.time()
         
         print("🎙️  麦克风已启动，开始监听...")
         
-        while self.is_running:
-            try:
-                # 在线程中读取音频数据（避免阻塞事件循环）
-                audio_data = await asyncio.to_thread(
-                    self.input_stream.read, CHUNK_SIZE, False
-                )
-                
-                # 检查 WebSocket 连接状态
-                if not self.ws or self.ws.closed:
-                    print("❌ WebSocket 连接已关闭")
-                    break
-                
-                # 🔇 如果 AI 正在播放语音，不发送麦克风数据（防止回音）
-                if self.is_ai_speaking and ENABLE_ECHO_CANCELLATION:
-                    # 检查音频能量，判断用户是否在说话（简单的 VAD）
-                    audio_level = calculate_audio_energy(audio_data)
+        try:
+            while self.is_running:
+                try:
+                    # 等待回调线程送来的音频小帧（20ms，逐帧做打断检测，攒够一批再发送）
+                    audio_data = await self._capture_q.get()
                     
-                    # 如果音频能量超过阈值，说明用户在说话，触发打断
-                    if audio_level > INTERRUPT_THRESHOLD and not self.cancel_sent:
-                        print(f"⚡ 检测到用户说话（能量: {audio_level}），打断AI回复")
-                        # 发送取消响应的消息
-                        try:
-                            await self.ws.send(json.dumps({
-                                "type": "response.cancel"
-                            }))
-                            self.cancel_sent = True
-                            self.is_ai_speaking = False
-                        except Exception as e:
-                            print(f"❌ 发送取消消息失败: {e}")
-                    else:
-                        # AI 在说话且用户没有打断，跳过这帧（防止回音）
+                    # 检查 WebSocket 连接状态
+                    if not self.ws or self.ws.closed:
+                        print("❌ WebSocket 连接已关闭")
+                        break
+                    
+                    # 🔇 如果 AI 正在播放语音，不发送麦克风数据（防止回音）
+                    # 播放队列中还有音频时也视为 AI 在说话
+                    if ENABLE_ECHO_CANCELLATION and (self.is_ai_speaking or self._player.is_playing()):
+                        # 检查音频能量，判断用户是否在说话（简单的 VAD）
+                        # 如果音频能量超过阈值，说明用户在说话，触发打断
+                        if not self.cancel_sent and audio_above_threshold(audio_data, INTERRUPT_THRESHOLD):
+                            audio_level = calculate_audio_energy(audio_data)  # 仅用于日志
+                            print(f"⚡ 检测到用户说话（能量: {audio_level}），打断AI回复")
+                            # 发送取消响应的消息
+                            try:
+                                await self.ws.send(json.dumps({
+                                    "type": "response.cancel"
+                                }))
+                                self.cancel_sent = True
+                                self.is_ai_speaking = False
+                                self._player.clear()
+                            except Exception as e:
+                                print(f"❌ 发送取消消息失败: {e}")
+                        else:
+                            # AI 在说话且用户没有打断，跳过这帧（防止回音）
+                            continue
+                    
+                    # 🎛️ 音频预处理（降噪、增益）
+                    # 只处理确定要发送的帧；被噪声门静音的帧仍然发送，服务器 VAD 靠静音判断说话结束
+                    processed_audio = preprocess_audio(audio_data)
+                    
+                    # 📦 累积音频，够一批或距上次发送超时后再合并发送
+                    self._send_buf += processed_audio
+                    if (len(self._send_buf) < SEND_BATCH_BYTES
+                            and self._loop.time() - self._last_flush < SEND_BATCH_MS / 1000):
                         continue
-                
-                # 🎛️ 音频预处理（降噪、增益）
-                processed_audio = preprocess_audio(audio_data)
-                
-                # 将音频编码为 base64 并发送
-                audio_b64 = base64.b64encode(processed_audio).decode('utf-8')
-                
-                message = {
-                    "type": "input_audio_buffer.append",
-                    "audio": audio_b64
-                }
-                
-                try:
-                    await self.ws.send(json.dumps(message))
+                    
+                    # 放入发送队列（队列满时在此等待，形成背压）
+                    await self._flush_audio()
+                    
                 except Exception as e:
                     if self.is_running:
-                        print(f"❌ 发送音频数据失败: {e}")
-                        break
-                
-                # 短暂延迟，避免发送过快
-                await asyncio.sleep(0.01)
+                        print(f"❌ 音频输入错误: {e}")
+                    break
+        finally:
+            # 通知写协程退出
+            await self._send_q.put(None)
                 
+    async def _flush_audio(self):
+        """把累积的音频合并成一条 input_audio_buffer.append 消息发送"""
+        # 将音频编码为 base64，原地写入消息头尾之间
+        frame = self._frame_buf
+        frame[len(self._audio_prefix):len(frame) - len(self._audio_suffix)] = \
+            b2a_base64(self._send_buf, newline=False)
+        self._send_buf.clear()
+        self._last_flush = self._loop.time()
+        
+        # 以文本帧发送（服务器要求 JSON 文本消息），交给写协程
+        await self._send_q.put(frame.decode('ascii'))
+    
+    async def _writer(self):
+        """写协程：从发送队列取消息，依次发送到 WebSocket"""
+        failed = False
+        while True:
+            message = await self._send_q.get()
+            if message is None:
+                break
+            if failed:
+                continue  # 发送已失败，只消费队列，避免输入协程阻塞
+            try:
+                await self.ws.send(message)
             except Exception as e:
+                failed = True
                 if self.is_running:
-                    print(f"❌ 音频输入错误: {e}")
-                break
-                
+                    print(f"❌ 发送音频数据失败: {e}")
+                    self.is_running = False
+    
+    def _on_capture(self, in_data, frame_count, time_info, status):
+        """麦克风采集回调（在 PortAudio 线程中运行）"""
+        self._loop.call_soon_threadsafe(self._enqueue_capture, in_data)
+        return (None, pyaudio.paContinue)
+    
+    def _enqueue_capture(self, audio_data):
+        """把采集到的音频放入队列（队列满时丢弃最旧的一块）"""
+        if self._capture_q.full():
+            self._capture_q.get_nowait()
+        self._capture_q.put_nowait(audio_data)
+    
     async def start_audio_output(self):
         """启动音频输出"""
-        # 通过调整播放采样率来改变播放速度
+        # 把 24kHz 音频当作 SAMPLE_RATE * PLAYBACK_SPEED 的采样率来播放即可改变播放速度
         playback_rate = int(SAMPLE_RATE * PLAYBACK_SPEED)
         
+        # 输出流使用声卡原生采样率，由我们自己重采样（避免驱动层转换非标准采样率）
+        try:
+            device_rate = int(self.audio.get_default_output_device_info()['defaultSampleRate'])
+        except (IOError, OSError):
+            device_rate = playback_rate
+        self._player = PlaybackBuffer(playback_rate, device_rate, PLAYBACK_FLUSH_BYTES)
+        
         self.output_stream = self.audio.open(
             format=FORMAT,
             channels=CHANNELS,
-            rate=playback_rate,  # 使用调整后的采样率
+            rate=device_rate,
             output=True,
-            frames_per_buffer=CHUNK_SIZE
+            frames_per_buffer=CHUNK_SIZE * device_rate // SAMPLE_RATE,  # 约 200ms
+            stream_callback=self._player.callback
         )
         
         if PLAYBACK_SPEED != 1.0:
             print(f"🔊 音频输出已启动（{PLAYBACK_SPEED}x 倍速播放）")
         else:
             print("🔊 音频输出已启动")
-        
+    
     async def handle_messages(self):
         """处理来自服务器的消息"""
+        handlers = self._handlers
         try:
             async for message in self.ws:
-                data = json.loads(message)
-                event_type = data.get("type")
-                
-                # 会话创建
-                if event_type == "session.created":
-                    self.session_id = data.get("session", {}).get("id")
-                    print(f"📝 会话已创建: {self.session_id}")
-                
-                # 会话更新
-                elif event_type == "session.updated":
-                    print("✅ 会话配置已更新")
-                
-                # 输入音频缓冲区已提交
-                elif event_type == "input_audio_buffer.committed":
-                    print("🎤 用户语音已提交")
-                
-                # 对话创建
-                elif event_type == "conversation.item.created":
-                    item = data.get("item", {})
-                    if item.get("role") == "user":
-                        print("👤 用户消息已创建")
-                
-                # 响应开始
-                elif event_type == "response.created":
-                    print("🤖 AI 开始生成回复...")
-                    self.cancel_sent = False  # 重置取消标志
-                
-                # 响应完成
-                elif event_type == "response.done":
-                    print("✅ AI 回复完成")
-                    self.is_ai_speaking = False
-                    self.cancel_sent = False
-                
-                # 音频转录（用户说的话）
-                elif event_type == "conversation.item.input_audio_transcription.completed":
-                    transcript = data.get("transcript", "")
-                    print(f"📝 你说: {transcript}")
+                data = _json_loads(message)
                 
-                # AI 文本回复
-                elif event_type == "response.text.delta":
-                    delta = data.get("delta", "")
-                    print(delta, end="", flush=True)
-                
-                elif event_type == "response.text.done":
-                    text = data.get("text", "")
-                    if text:
-                        print(f"\n💬 AI 回复: {text}")
-                
-                # 音频数据
-                elif event_type == "response.audio.delta":
-                    self.is_ai_speaking = True
-                    audio_b64 = data.get("delta", "")
-                    if audio_b64:
-                        # 解码并播放音频
-                        audio_data = base64.b64decode(audio_b64)
-                        if self.output_stream:
-                            self.output_stream.write(audio_data)
-                
-                elif event_type == "response.audio.done":
-                    print("🔊 AI 语音播放完成")
-                    self.is_ai_speaking = False
-                
-                # 响应被取消（打断）
-                elif event_type == "response.cancelled":
-                    print("⚡ AI 回复已被打断")
-                    self.is_ai_speaking = False
-                    self.cancel_sent = False
-                
-                # 错误处理
-                elif event_type == "error":
-                    error = data.get("error", {})
-                    print(f"❌ 错误: {error.get('message', '未知错误')}")
+                # 按事件类型查表分发（未知事件忽略）
+                handler = handlers.get(data.get("type"))
+                if handler is not None:
+                    handler(data)
                 
         except websockets.exceptions.ConnectionClosed:
             print("🔌 连接已关闭")
         except Exception as e:
             print(f"❌ 消息处理错误: {e}")
+    
+    # 音频数据
+    def _handle_audio_delta(self, data):
+        self.is_ai_speaking = True
+        audio_b64 = data.get("delta", "")
+        if audio_b64:
+            # 解码后先攒起来，够一块或播放队列已空时再交给输出回调播放（不阻塞接收循环）
+            if self.output_stream:
+                self._player.write(a2b_base64(audio_b64))
+    
+    def _handle_audio_done(self, data):
+        self._player.flush()
+        print("🔊 AI 语音播放完成")
+        self.is_ai_speaking = False
+    
+    # AI 文本回复
+    def _handle_text_delta(self, data):
+        delta = data.get("delta", "")
+        print(delta, end="", flush=True)
+    
+    def _handle_text_done(self, data):
+        text = data.get("text", "")
+        if text:
+            print(f"\n💬 AI 回复: {text}")
+    
+    # 会话创建
+    def _handle_session_created(self, data):
+        self.session_id = data.get("session", {}).get("id")
+        print(f"📝 会话已创建: {self.session_id}")
+    
+    # 会话更新
+    def _handle_session_updated(self, data):
+        print("✅ 会话配置已更新")
+    
+    # 输入音频缓冲区已提交
+    def _handle_audio_committed(self, data):
+        print("🎤 用户语音已提交")
+    
+    # 对话创建
+    def _handle_item_created(self, data):
+        item = data.get("item", {})
+        if item.get("role") == "user":
+            print("👤 用户消息已创建")
+    
+    # 响应开始
+    def _handle_response_created(self, data):
+        print("🤖 AI 开始生成回复...")
+        self.cancel_sent = False  # 重置取消标志
+    
+    # 响应完成
+    def _handle_response_done(self, data):
+        print("✅ AI 回复完成")
+        self.is_ai_speaking = False
+        self.cancel_sent = False
+    
+    # 音频转录（用户说的话）
+    def _handle_transcription(self, data):
+        transcript = data.get("transcript", "")
+        print(f"📝 你说: {transcript}")
+    
+    # 响应被取消（打断）
+    def _handle_response_cancelled(self, data):
+        print("⚡ AI 回复已被打断")
+        self.is_ai_speaking = False
+        self._player.clear()
+        self.cancel_sent = False
+    
+    # 错误处理
+    def _handle_error(self, data):
+        error = data.get("error", {})
+        print(f"❌ 错误: {error.get('message', '未知错误')}")
             
     async def run(self):
         """运行客户端"""
@@ -325,6 +549,9 @@ class RealtimeClient:
             # 启动音频输出
             await self.start_audio_output()
             
+            # 预热音频预处理（JIT 编译）
+            warmup_preprocess()
+            
             # 设置运行标志
             self.is_running = True
             
@@ -349,9 +576,13 @@ class RealtimeClient:
             print("🛑 按 Ctrl+C 退出")
             print("="*60 + "\n")
             
-            # 并发运行音频输入和消息处理
+            # 发送队列有界：网络拥塞时输入协程会被阻塞，而不是无限堆积
+            self._send_q = asyncio.Queue(maxsize=8)
+            
+            # 并发运行音频输入、发送和消息处理
             await asyncio.gather(
                 self.start_audio_input(),
+                self._writer(),
                 self.handle_messages()
             )
             
@@ -403,5 +634,8 @@ async def main():
     await client.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
@@ -4,21 +4,52 @@
 OpenAI Realtime 客户端 - 本地 Whisper ASR + OpenAI TTS
 """
 
+import os
+
+# 🔧 Whisper 推理线程数（三种后端和 OpenMP / MKL 统一使用）
+# 取一半核心、最多 8 个：小模型的矩阵很小，线程过多时 fork/join 开销反而拖慢推理
+WHISPER_CPU_THREADS = min(8, max(1, (os.cpu_count() or 2) // 2))
+
+# 环境变量须在导入 numpy / torch 之前设置（已有环境变量优先）
+os.environ.setdefault("OMP_NUM_THREADS", str(WHISPER_CPU_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(WHISPER_CPU_THREADS))
+
 import asyncio
 import websockets
 import json
 import pyaudio
 import numpy as np
-import os
+import math
 from dotenv import load_dotenv
 import signal
 import sys
-import torch
-import whisper
 import time
-import base64
+from binascii import a2b_base64
 from function_tools import FUNCTION_DEFINITIONS, execute_function
+from audio_playback import PlaybackBuffer
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson  # 可选：更快的 JSON 解析/序列化
+    _json_loads = orjson.loads
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+try:
+    import uvloop  # 可选：基于 libuv 的更快事件循环（不支持 Windows）
+except ImportError:
+    uvloop = None
+
+try:
+    from numba import njit  # 可选：JIT 编译 VAD 能量计算
+except ImportError:
+    njit = None
 
 # 加载环境变量
 load_dotenv()
@@ -40,6 +71,23 @@ WHISPER_MODEL = "small"  # 🎯 可选: tiny, base, small, medium, large
 # medium - 很准确但慢
 # large  - 最准确但很慢
 
+# 🔧 Whisper 推理后端
+WHISPER_BACKEND = "faster-whisper"  # 🎯 可选: faster-whisper, whispercpp, openai
+# faster-whisper - CTranslate2 INT8 推理，CPU 上更快、更省内存（推荐）✅
+# whispercpp     - whisper.cpp 量化模型（Q5），内存占用最小，适合小内存设备
+# openai         - 官方 PyTorch 实现（FP32）
+# 推理线程数见文件开头的 WHISPER_CPU_THREADS（需在导入 numpy 之前确定）
+# whispercpp 使用的量化模型（medium 只发布了 q5_0；没有单独的 large，对应 large-v3）
+WHISPER_CPP_MODELS = {
+    "tiny": "tiny-q5_1",
+    "base": "base-q5_1",
+    "small": "small-q5_1",
+    "medium": "medium-q5_0",
+    "large": "large-v3-q5_0",
+}
+WHISPER_CPU_AFFINITY = None  # 🎯 识别线程绑定的 CPU 核心（仅 Linux），例如 {0, 1, 2, 3}；None 表示不绑定
+LOCK_LANGUAGE = True  # 🎯 首次识别后锁定语言，后续跳过语言检测（会话中途换语言请设为 False）
+
 # 音频参数
 SAMPLE_RATE = 16000  # Whisper 要求 16kHz
 CHANNELS = 1
@@ -50,13 +98,69 @@ FORMAT = pyaudio.paInt16
 ENERGY_THRESHOLD = 300  # 🎯 语音能量阈值（100-1000），越小越敏感
 SILENCE_DURATION = 1.0  # 🎯 静音多久后结束（秒），建议 0.8-2.0
 MIN_SPEECH_DURATION = 0.3  # 最小语音时长（秒）
+MAX_SPEECH_BUFFER_DURATION = 30  # 语音缓冲区最多保留多少秒（超出后覆盖最早的音频）
+PRE_ROLL_DURATION = 0.3  # 检测到语音前保留多少秒背景音（避免吞掉开头的字）
 
 # TTS 参数
 TTS_VOICE = "shimmer"  # 🎯 可选: alloy, echo, fable, onyx, nova, shimmer
 PLAYBACK_SPEED = 1.0  # 🎯 播放速度（1.0 = 正常，1.2 = 1.2倍速）
+OUTPUT_BUFFER_DURATION = 0.04  # 输出流每个缓冲区时长（秒）；打断时已交给声卡的音频最多这么长
 
 # ============================================================
 
+# 由配置推导的常量（导入时计算一次）
+MIN_SPEECH_FRAMES = int(SAMPLE_RATE * MIN_SPEECH_DURATION / CHUNK_SIZE)  # 最少语音帧数
+MIN_SPEECH_SAMPLES = MIN_SPEECH_FRAMES * CHUNK_SIZE  # 最少语音样本数
+PRE_ROLL_FRAMES = max(1, round(SAMPLE_RATE * PRE_ROLL_DURATION / CHUNK_SIZE))  # 预录帧数
+PLAYBACK_COALESCE_BYTES = 32 * 1024  # 连续音频增量最多合并多少字节再写入（约 0.7 秒 24kHz 音频）
+
+# 固定的控制消息（预先序列化，每轮对话无需构造字典和 json.dumps）
+CANCEL_MSG = '{"type":"response.cancel"}'
+RESPONSE_CREATE_MSG = '{"type":"response.create"}'
+RESPONSE_CREATE_AUDIO_MSG = '{"type":"response.create","response":{"modalities":["audio","text"]}}'
+
+# session.update 消息（内容完全由上面的配置决定，导入时序列化一次）
+SESSION_UPDATE_MSG = _json_dumps({
+    "type": "session.update",
+    "session": {
+        "modalities": ["text", "audio"],
+        "instructions": (
+            "你是一个友好的多语言AI助手，名叫小助手。你可以：\n"
+            "1. 用户说什么语言，你就用什么语言回复\n"
+            "2. 查询天气信息\n"
+            "3. 推荐龙凤楼中餐厅的美食\n"
+            "4. 搜索和推荐书籍\n"
+            "5. 当用户明确表示要结束对话时，调用 end_conversation 函数\n\n"
+            "回复风格：简洁、自然、友好。使用 function calling 来处理具体查询。"
+        ),
+        "voice": TTS_VOICE,
+        "output_audio_format": "pcm16",
+        "turn_detection": None,  # 关闭服务器端 VAD，使用本地 VAD
+        "tools": FUNCTION_DEFINITIONS  # 🎯 添加 function calling
+    }
+})
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def vad_energy(buf):
+        """计算 int16 音频帧的 RMS 能量（JIT 编译，单趟累加平方和）"""
+        n = buf.shape[0]
+        if n == 0:
+            return 0.0
+        total = np.int64(0)
+        for i in range(n):
+            v = np.int64(buf[i])
+            total += v * v
+        return math.sqrt(total / n)
+else:
+    def vad_energy(buf):
+        """计算 int16 音频帧的 RMS 能量"""
+        if buf.size == 0:
+            return 0.0
+        # 转 int64 后一次点积得到平方和（无浮点转换、平方、求均值多趟临时数组，也不会溢出）
+        samples = buf.astype(np.int64)
+        return math.sqrt(int(np.dot(samples, samples)) / samples.size)
+
 class RealtimeLocalASR:
     def __init__(self):
         self.ws = None
@@ -70,32 +174,118 @@ class RealtimeLocalASR:
         # Whisper
         self.whisper_model = None
         self.device = "cpu"
+        self.detected_language = None  # 本次会话锁定的语言（None 表示自动检测）
+        # 专用识别线程（常驻，模型权重留在同一组核心的缓存中）
+        self._asr_pool = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="asr",
+            initializer=self._pin_asr_thread
+        )
         
         # VAD
-        self.speech_buffer = []
+        # 语音缓冲区：预分配的 int16 环形缓冲，避免逐帧保存 bytes 再拼接
+        self.speech_buffer = np.empty(SAMPLE_RATE * MAX_SPEECH_BUFFER_DURATION, dtype=np.int16)
+        self.speech_pos = 0  # 下一个写入位置
+        self.speech_samples = 0  # 缓冲区中的有效样本数
+        self.voiced_samples = 0  # 其中超过 VAD 阈值的样本数（不含预录背景音）
+        self._norm_scale = np.float32(1.0 / 32768.0)  # int16 -> [-1, 1) 归一化系数
         self.is_speaking = False
         self.silence_start = None
+        self._preroll = deque(maxlen=PRE_ROLL_FRAMES)  # 最近的背景音帧
         
         # 打断控制
-        self.interrupt_flag = False
+        self.interrupt_event = asyncio.Event()  # 键盘线程触发，无需轮询
+        
+        # 麦克风采集队列（采集线程 -> 事件循环）
+        self._mic_q = None
+        self._mic_thread = None
+        
+        # 播放队列（事件循环 -> 输出回调线程）
+        self._player = None  # 播放缓冲（含重采样到声卡原生采样率），启动输出时创建
         
     def load_whisper(self):
         """加载 Whisper 模型"""
-        print(f"🔄 正在加载 Whisper 模型: {WHISPER_MODEL}")
+        print(f"🔄 正在加载 Whisper 模型: {WHISPER_MODEL}（{WHISPER_BACKEND}）")
         start_time = time.time()
         
-        self.whisper_model = whisper.load_model(WHISPER_MODEL, device=self.device)
+        # 按需导入对应后端（不用的后端不必安装）
+        if WHISPER_BACKEND == "faster-whisper":
+            from faster_whisper import WhisperModel
+            self.whisper_model = WhisperModel(
+                WHISPER_MODEL,
+                device=self.device,
+                compute_type="int8",
+                cpu_threads=WHISPER_CPU_THREADS
+            )
+        elif WHISPER_BACKEND == "whispercpp":
+            cpp_model = WHISPER_CPP_MODELS.get(WHISPER_MODEL)
+            if cpp_model is None:
+                raise ValueError(f"whispercpp 后端不支持模型: {WHISPER_MODEL}"
+                                 f"（可选: {', '.join(WHISPER_CPP_MODELS)}）")
+            from pywhispercpp.model import Model
+            self.whisper_model = Model(
+                cpp_model,
+                n_threads=WHISPER_CPU_THREADS,
+                print_progress=False,
+                print_realtime=False
+            )
+        elif WHISPER_BACKEND == "openai":
+            import torch
+            import whisper
+            torch.set_num_threads(WHISPER_CPU_THREADS)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass  # 已有并行任务运行过时不能再修改
+            # in_memory=True：一次性读入权重，首次识别不再触发 mmap 缺页读取
+            self.whisper_model = whisper.load_model(WHISPER_MODEL, device=self.device, in_memory=True)
+        else:
+            raise ValueError(f"未知的 Whisper 后端: {WHISPER_BACKEND}")
         
         load_time = time.time() - start_time
         print(f"✅ Whisper 模型加载完成（耗时: {load_time:.2f}秒）")
         
-    def calculate_energy(self, audio_data):
-        """计算音频能量"""
-        audio_array = np.frombuffer(audio_data, dtype=np.int16)
-        if len(audio_array) == 0:
-            return 0
-        energy = np.mean(audio_array.astype(np.float32) ** 2)
-        return np.sqrt(energy) if energy > 0 else 0
+    @staticmethod
+    def _pin_asr_thread():
+        """把识别线程绑定到指定 CPU 核心"""
+        if WHISPER_CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, WHISPER_CPU_AFFINITY)
+            except OSError as e:
+                print(f"⚠️  设置识别线程 CPU 亲和性失败: {e}")
+    
+    def _transcribe(self, audio_array, language=None):
+        """
+        用当前后端识别音频（阻塞，在线程中调用）
+        language 为 None 时自动检测语言
+        返回: (文本, 语言)
+        """
+        if WHISPER_BACKEND == "faster-whisper":
+            segments, info = self.whisper_model.transcribe(
+                audio_array,
+                language=language,
+                beam_size=1,
+                vad_filter=False
+            )
+            # segments 是生成器，遍历时才真正解码
+            text = "".join(segment.text for segment in segments)
+            return text.strip(), info.language
+        
+        if WHISPER_BACKEND == "whispercpp":
+            # whisper.cpp 不返回识别出的语言，先单独检测再按该语言解码
+            if language is None:
+                (language, _), _ = self.whisper_model.auto_detect_language(audio_array)
+            segments = self.whisper_model.transcribe(audio_array, language=language)
+            text = "".join(segment.text for segment in segments)
+            return text.strip(), language
+        
+        result = self.whisper_model.transcribe(
+            audio_array,
+            language=language,
+            fp16=False,
+            verbose=False
+        )
+        return result["text"].strip(), result["language"]
     
     async def connect(self):
         """连接到 OpenAI Realtime API"""
@@ -107,34 +297,21 @@ class RealtimeLocalASR:
         url = f"{REALTIME_API_URL}?model={MODEL}"
         
         print("🔄 正在连接到 OpenAI Realtime API...")
-        self.ws = await websockets.connect(url, extra_headers=headers)
+        self.ws = await websockets.connect(
+            url,
+            extra_headers=headers,
+            compression=None,  # base64 音频几乎无法压缩，关闭 permessage-deflate 省去每帧 zlib
+            max_size=None,  # 不限制单条消息大小
+            max_queue=64,  # 允许更多已接收但未处理的消息排队
+            read_limit=2**20  # 更大的读缓冲区，减少拷贝次数
+        )
         print("✅ 已连接到 OpenAI Realtime API")
         
         await self.configure_session()
         
     async def configure_session(self):
         """配置会话参数"""
-        config = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["text", "audio"],
-                "instructions": (
-                    "你是一个友好的多语言AI助手，名叫小助手。你可以：\n"
-                    "1. 用户说什么语言，你就用什么语言回复\n"
-                    "2. 查询天气信息\n"
-                    "3. 推荐龙凤楼中餐厅的美食\n"
-                    "4. 搜索和推荐书籍\n"
-                    "5. 当用户明确表示要结束对话时，调用 end_conversation 函数\n\n"
-                    "回复风格：简洁、自然、友好。使用 function calling 来处理具体查询。"
-                ),
-                "voice": TTS_VOICE,
-                "output_audio_format": "pcm16",
-                "turn_detection": None,  # 关闭服务器端 VAD，使用本地 VAD
-                "tools": FUNCTION_DEFINITIONS  # 🎯 添加 function calling
-            }
-        }
-        
-        await self.ws.send(json.dumps(config))
+        await self.ws.send(SESSION_UPDATE_MSG)
         print(f"⚙️  会话配置已发送（TTS: {TTS_VOICE}，Functions: {len(FUNCTION_DEFINITIONS)}个）")
         
     async def start_audio_input(self):
@@ -147,75 +324,151 @@ class RealtimeLocalASR:
             frames_per_buffer=CHUNK_SIZE
         )
         
+        # 常驻采集线程持续阻塞读取麦克风，通过队列交给事件循环（无需每帧派发线程池任务）
+        self._mic_q = asyncio.Queue(maxsize=64)  # 约 4 秒音频
+        loop = asyncio.get_running_loop()
+        self._mic_thread = threading.Thread(target=self._mic_producer, args=(loop,), daemon=True)
+        self._mic_thread.start()
+        
         print("🎙️  麦克风已启动，开始监听...")
         
         while self.is_running:
             try:
                 # 读取音频
-                audio_data = await asyncio.to_thread(
-                    self.input_stream.read, CHUNK_SIZE, False
-                )
+                audio_data = await self._mic_q.get()
+                if audio_data is None:
+                    break  # 采集线程已退出
                 
-                # 只在 AI 不说话时处理用户输入
-                if not self.is_ai_speaking:
-                    energy = self.calculate_energy(audio_data)
+                # 只在 AI 不说话时处理用户输入（还有音频在播放也算在说话）
+                if not (self.is_ai_speaking or self._player.is_playing()):
+                    energy = vad_energy(np.frombuffer(audio_data, dtype=np.int16))
                     
                     # VAD: 检测语音活动
                     if energy > ENERGY_THRESHOLD:
                         if not self.is_speaking:
                             print("🗣️  检测到语音...")
                             self.is_speaking = True
+                            
+                            # 先写入语音开始前的一小段背景音
+                            self._reset_speech()
+                            for frame in self._preroll:
+                                self._append_speech(frame)
+                            self._preroll.clear()
                         
-                        self.speech_buffer.append(audio_data)
+                        self._append_speech(audio_data)
+                        self.voiced_samples += CHUNK_SIZE
                         self.silence_start = None
                     else:
                         if self.is_speaking:
                             if self.silence_start is None:
-                                self.silence_start = time.time()
-                            elif time.time() - self.silence_start > SILENCE_DURATION:
+                                self.silence_start = time.monotonic()
+                            elif time.monotonic() - self.silence_start > SILENCE_DURATION:
                                 # 静音足够长，识别语音
                                 print("🔇 语音结束，开始识别...")
                                 await self._process_speech()
-                                self.speech_buffer = []
+                                self._reset_speech()
                                 self.is_speaking = False
                                 self.silence_start = None
                         else:
-                            # 收集背景音（用于更准确的 VAD）
-                            self.speech_buffer.append(audio_data)
-                
-                await asyncio.sleep(0.001)
+                            # 只保留最近一小段背景音（用于更准确的 VAD）
+                            self._preroll.append(audio_data)
                 
             except Exception as e:
                 if self.is_running:
                     print(f"❌ 音频输入错误: {e}")
                 break
                 
+    def _mic_producer(self, loop):
+        """
+        麦克风采集线程：循环读取音频并放入队列
+        is_running 变为 False 后最多再读一帧即退出，退出时放入 None 通知事件循环
+        """
+        while self.is_running:
+            try:
+                audio_data = self.input_stream.read(CHUNK_SIZE, False)
+            except Exception as e:
+                print(f"❌ 麦克风读取失败: {e}")
+                break
+            try:
+                loop.call_soon_threadsafe(self._enqueue_mic, audio_data)
+            except RuntimeError:
+                return  # 事件循环已关闭
+        
+        try:
+            loop.call_soon_threadsafe(self._enqueue_mic, None)
+        except RuntimeError:
+            pass
+    
+    def _enqueue_mic(self, audio_data):
+        """把采集到的音频放入队列（队列满时丢弃最旧的一帧）"""
+        if self._mic_q.full():
+            self._mic_q.get_nowait()
+        self._mic_q.put_nowait(audio_data)
+    
+    def _append_speech(self, audio_data):
+        """把一帧音频写入环形缓冲区（满了覆盖最早的音频）"""
+        frame = np.frombuffer(audio_data, dtype=np.int16)
+        buf = self.speech_buffer
+        capacity = buf.size
+        n = frame.size
+        
+        if n >= capacity:
+            buf[:] = frame[n - capacity:]
+            self.speech_pos = 0
+            self.speech_samples = capacity
+            return
+        
+        end = self.speech_pos + n
+        if end <= capacity:
+            buf[self.speech_pos:end] = frame
+        else:
+            # 写到末尾后绕回开头
+            head = capacity - self.speech_pos
+            buf[self.speech_pos:] = frame[:head]
+            buf[:n - head] = frame[head:]
+        
+        self.speech_pos = end % capacity
+        self.speech_samples = min(self.speech_samples + n, capacity)
+    
+    def _reset_speech(self):
+        """清空语音缓冲区"""
+        self.speech_pos = 0
+        self.speech_samples = 0
+        self.voiced_samples = 0
+    
     async def _process_speech(self):
         """处理并识别语音"""
-        if len(self.speech_buffer) < int(SAMPLE_RATE * MIN_SPEECH_DURATION / CHUNK_SIZE):
+        # 只按真正的语音帧计算时长，预录背景音不算（否则一声咳嗽加上预录就能通过）
+        if self.voiced_samples < MIN_SPEECH_SAMPLES:
             print("⚠️  语音太短，跳过")
             return
         
-        # 合并音频
-        audio_data = b''.join(self.speech_buffer)
-        audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+        # 按时间顺序取出缓冲区中的音频，转换和归一化一趟完成（绕回时分两段写入，不做拼接）
+        buf = self.speech_buffer
+        n = self.speech_samples
+        start = (self.speech_pos - n) % buf.size
+        audio_array = np.empty(n, dtype=np.float32)
+        if start + n <= buf.size:
+            np.multiply(buf[start:start + n], self._norm_scale, out=audio_array)
+        else:
+            head = buf.size - start
+            np.multiply(buf[start:], self._norm_scale, out=audio_array[:head])
+            np.multiply(buf[:self.speech_pos], self._norm_scale, out=audio_array[head:])
         
         print("🔍 正在识别...")
         recognize_start = time.time()
         
         try:
             # Whisper 识别
-            result = await asyncio.to_thread(
-                self.whisper_model.transcribe,
-                audio_array,
-                language=None,  # 自动检测语言
-                fp16=False,
-                verbose=False
+            # 已锁定语言时直接按该语言解码，省去一次语言检测
+            text, language = await asyncio.get_running_loop().run_in_executor(
+                self._asr_pool, self._transcribe, audio_array, self.detected_language
             )
             
             recognize_time = time.time() - recognize_start
-            text = result["text"].strip()
-            language = result["language"]
+            
+            if LOCK_LANGUAGE and text and self.detected_language is None:
+                self.detected_language = language
             
             if text:
                 print(f"📝 你说: {text} [{language}] (耗时: {recognize_time:.2f}秒)")
@@ -243,16 +496,10 @@ class RealtimeLocalASR:
                 ]
             }
         }
-        await self.ws.send(json.dumps(message))
+        await self.ws.send(_json_dumps(message))
         
         # 请求响应
-        response_msg = {
-            "type": "response.create",
-            "response": {
-                "modalities": ["audio", "text"]
-            }
-        }
-        await self.ws.send(json.dumps(response_msg))
+        await self.ws.send(RESPONSE_CREATE_AUDIO_MSG)
     
     async def _send_function_result(self, call_id, result):
         """发送函数执行结果给 OpenAI"""
@@ -261,27 +508,32 @@ class RealtimeLocalASR:
             "item": {
                 "type": "function_call_output",
                 "call_id": call_id,
-                "output": json.dumps(result, ensure_ascii=False)
+                "output": _json_dumps(result)
             }
         }
-        await self.ws.send(json.dumps(message))
+        await self.ws.send(_json_dumps(message))
         
         # 请求 AI 继续响应
-        response_msg = {
-            "type": "response.create"
-        }
-        await self.ws.send(json.dumps(response_msg))
+        await self.ws.send(RESPONSE_CREATE_MSG)
         
     async def start_audio_output(self):
         """启动音频输出"""
         playback_rate = int(24000 * PLAYBACK_SPEED)  # OpenAI 输出是 24kHz
         
+        # 输出流使用声卡原生采样率，由我们自己重采样（避免驱动层转换非标准采样率）
+        try:
+            device_rate = int(self.audio.get_default_output_device_info()['defaultSampleRate'])
+        except (IOError, OSError):
+            device_rate = playback_rate
+        self._player = PlaybackBuffer(playback_rate, device_rate, PLAYBACK_COALESCE_BYTES)
+        
         self.output_stream = self.audio.open(
             format=FORMAT,
             channels=CHANNELS,
-            rate=playback_rate,
+            rate=device_rate,
             output=True,
-            frames_per_buffer=4800
+            frames_per_buffer=int(device_rate * OUTPUT_BUFFER_DURATION),
+            stream_callback=self._player.callback  # 回调模式：接收循环只需把音频放进队列，不会被阻塞
         )
         
         if PLAYBACK_SPEED != 1.0:
@@ -291,12 +543,14 @@ class RealtimeLocalASR:
     
     async def keyboard_listener(self):
         """监听键盘输入（按回车打断）"""
+        loop = asyncio.get_running_loop()
+        
         def listen_keyboard():
             while self.is_running:
                 try:
                     input()  # 等待回车键
-                    if self.is_ai_speaking:
-                        self.interrupt_flag = True
+                    if self.is_ai_speaking or self._player.is_playing():
+                        loop.call_soon_threadsafe(self.interrupt_event.set)
                 except:
                     break
         
@@ -304,47 +558,47 @@ class RealtimeLocalASR:
         thread = threading.Thread(target=listen_keyboard, daemon=True)
         thread.start()
         
-        # 检查打断标志
+        # 等待打断事件（空闲时不唤醒事件循环）
         while self.is_running:
-            if self.interrupt_flag:
-                print("\n⚡ 检测到打断（回车键），取消 AI 响应")
-                
-                # 🎯 发送取消消息到服务器（停止 LLM 和 TTS 生成）
-                try:
-                    cancel_msg = {
-                        "type": "response.cancel"
-                    }
-                    await self.ws.send(json.dumps(cancel_msg))
-                    print("📤 已发送取消请求到服务器")
-                except Exception as e:
-                    print(f"❌ 发送取消请求失败: {e}")
-                
-                # 停止 AI 播放
-                self.is_ai_speaking = False
-                
-                # 清空输出缓冲区
-                if self.output_stream:
-                    try:
-                        # 停止并重启输出流以清空缓冲区
-                        self.output_stream.stop_stream()
-                        self.output_stream.start_stream()
-                    except:
-                        pass
-                
-                # 重置标志
-                self.interrupt_flag = False
-                
-                print("🎙️  已恢复监听，可以继续说话...")
+            await self.interrupt_event.wait()
+            self.interrupt_event.clear()
+            if not self.is_running:
+                break
             
-            await asyncio.sleep(0.1)
+            print("\n⚡ 检测到打断（回车键），取消 AI 响应")
+            
+            # 🎯 发送取消消息到服务器（停止 LLM 和 TTS 生成）
+            try:
+                await self.ws.send(CANCEL_MSG)
+                print("📤 已发送取消请求到服务器")
+            except Exception as e:
+                print(f"❌ 发送取消请求失败: {e}")
+            
+            # 停止 AI 播放
+            self.is_ai_speaking = False
+            
+            # 清空待播放的音频（无需停止并重启输出流）
+            self._player.clear()
+            
+            print("🎙️  已恢复监听，可以继续说话...")
         
     async def handle_messages(self):
         """处理来自服务器的消息"""
         try:
             async for message in self.ws:
-                data = json.loads(message)
+                data = _json_loads(message)
                 event_type = data.get("type")
                 
+                if event_type == "response.audio.delta":
+                    self.is_ai_speaking = True
+                    audio_b64 = data.get("delta", "")
+                    if audio_b64 and self.output_stream:
+                        self._player.write(a2b_base64(audio_b64))
+                    continue
+                
+                # 其他事件到来前先把攒下的音频交给播放队列，保持先后顺序
+                self._player.flush()
+                
                 if event_type == "session.created":
                     self.session_id = data.get("session", {}).get("id")
                     print(f"📝 会话已创建: {self.session_id}")
@@ -368,13 +622,6 @@ class RealtimeLocalASR:
                     if text:
                         print(f"\n💬 AI: {text}")
                 
-                elif event_type == "response.audio.delta":
-                    self.is_ai_speaking = True
-                    audio_b64 = data.get("delta", "")
-                    if audio_b64 and self.output_stream:
-                        audio_data = base64.b64decode(audio_b64)
-                        self.output_stream.write(audio_data)
-                
                 elif event_type == "response.audio.done":
                     print("🔊 AI 语音播放完成")
                     self.is_ai_speaking = False
@@ -395,7 +642,7 @@ class RealtimeLocalASR:
                     
                     # 执行函数
                     try:
-                        arguments = json.loads(arguments_str)
+                        arguments = _json_loads(arguments_str)
                         result = execute_function(function_name, arguments)
                         
                         print(f"✅ 函数结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
@@ -403,10 +650,12 @@ class RealtimeLocalASR:
                         # 🎯 特殊处理：end_conversation
                         if function_name == "end_conversation":
                             print("\n👋 用户选择结束对话")
+                            self.detected_language = None  # 下一位用户重新检测语言
                             # 先发送函数结果，然后退出
                             await self._send_function_result(call_id, result)
                             await asyncio.sleep(2)  # 等待 AI 说完再见
                             self.is_running = False
+                            self.interrupt_event.set()  # 唤醒键盘监听，使其退出
                             return
                         
                         # 发送函数结果给 OpenAI
@@ -437,6 +686,9 @@ class RealtimeLocalASR:
             # 加载 Whisper
             self.load_whisper()
             
+            # 预热 VAD 能量计算（JIT 编译），避免第一帧音频卡顿
+            vad_energy(np.zeros(CHUNK_SIZE, dtype=np.int16))
+            
             # 连接服务器
             await self.connect()
             
@@ -447,11 +699,11 @@ class RealtimeLocalASR:
             
             print("\n" + "="*60)
             print("🎉 Realtime 客户端已启动（本地 ASR + Function Calling）")
-            print(f"🎙️  本地 ASR: Whisper {WHISPER_MODEL.upper()}")
+            print(f"🎙️  本地 ASR: Whisper {WHISPER_MODEL.upper()}（{WHISPER_BACKEND}）")
             print(f"🗣️  OpenAI TTS: {TTS_VOICE}")
             print(f"🎚️  VAD 阈值: {ENERGY_THRESHOLD}")
             print(f"⏱️  静音时长: {SILENCE_DURATION}秒")
-            print("🌍 多语言自动识别")
+            print("🌍 多语言自动识别" + ("（首次识别后锁定语言）" if LOCK_LANGUAGE else ""))
             print("\n🔧 可用功能:")
             print("  📍 查天气 - 问「北京今天天气怎么样？」")
             print("  🍜 查菜单 - 问「有什么推荐的菜？」「有不辣的菜吗？」")
@@ -482,6 +734,16 @@ class RealtimeLocalASR:
     async def cleanup(self):
         """清理资源"""
         self.is_running = False
+        self.interrupt_event.set()
+        
+        self._asr_pool.shutdown(wait=False)
+        
+        # 先等采集线程退出（正在进行的 read 最多阻塞一帧），再关闭输入流；
+        # 设备读取卡住时最多等 1 秒，仍然关闭输入流，避免退出时挂起
+        if self._mic_thread:
+            await asyncio.to_thread(self._mic_thread.join, 1.0)
+            if self._mic_thread.is_alive():
+                print("⚠️  麦克风采集线程未及时退出，强制关闭输入流")
         
         if self.input_stream:
             self.input_stream.stop_stream()
@@ -521,5 +783,8 @@ async def main():
     await client.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
@@ -10,6 +10,8 @@ import pyaudio
 import numpy as np
 import time
 import wave
+import queue
+from multiprocessing import Process, Queue, shared_memory
 
 # 音频参数
 SAMPLE_RATE = 16000
@@ -19,7 +21,10 @@ FORMAT = pyaudio.paInt16
 RECORD_SECONDS = 10  # 录音时长
 
 def record_audio(duration=5):
-    """录制音频"""
+    """
+    录制音频
+    返回: (原始 16-bit PCM 字节, float32 音频数组)
+    """
     print(f"\n🎙️  开始录音（{duration}秒，约{duration/60:.1f}分钟）...")
     print("💬 请说话...")
     
@@ -33,21 +38,20 @@ def record_audio(duration=5):
         frames_per_buffer=CHUNK_SIZE
     )
     
-    frames = []
-    total_chunks = int(SAMPLE_RATE / CHUNK_SIZE * duration)
+    total_samples = int(SAMPLE_RATE * duration)
+    raw = bytearray(total_samples * 2)  # 16-bit 单声道，预先分配整段录音
+    view = memoryview(raw)
     
-    # 显示进度
+    # 每次读取 1 秒音频直接写入缓冲区，顺便显示进度
     import sys
-    for i in range(total_chunks):
-        data = stream.read(CHUNK_SIZE, exception_on_overflow=False)
-        frames.append(data)
+    for start in range(0, total_samples, SAMPLE_RATE):
+        n = min(SAMPLE_RATE, total_samples - start)
+        view[start * 2:(start + n) * 2] = stream.read(n, exception_on_overflow=False)
         
-        # 每秒显示一次进度
-        if i % (SAMPLE_RATE // CHUNK_SIZE) == 0:
-            elapsed = i / (SAMPLE_RATE / CHUNK_SIZE)
-            progress = (elapsed / duration) * 100
-            sys.stdout.write(f"\r⏱️  录音进度: {elapsed:.0f}/{duration}秒 ({progress:.1f}%)")
-            sys.stdout.flush()
+        elapsed = (start + n) / SAMPLE_RATE
+        progress = (elapsed / duration) * 100
+        sys.stdout.write(f"\r⏱️  录音进度: {elapsed:.0f}/{duration}秒 ({progress:.1f}%)")
+        sys.stdout.flush()
     
     print("\n✅ 录音完成！")
     
@@ -55,11 +59,11 @@ def record_audio(duration=5):
     stream.close()
     audio.terminate()
     
-    # 转换为 numpy 数组
-    audio_data = b''.join(frames)
-    audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+    # 转换为 numpy 数组（一次转换 + 原地缩放）
+    audio_array = np.frombuffer(raw, dtype=np.int16).astype(np.float32)
+    audio_array *= 1 / 32768.0
     
-    return audio_array
+    return raw, audio_array
 
 def test_model(model_name, audio_data):
     """测试单个模型"""
@@ -102,6 +106,39 @@ def test_model(model_name, audio_data):
         "transcribe_time": transcribe_time
     }
 
+def _test_model_worker(model_name, shm_name, num_samples, results):
+    """子进程入口：从共享内存读取音频并测试单个模型，结果放入队列"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    audio_data = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+    try:
+        result = test_model(model_name, audio_data)
+    except Exception as e:
+        result = {"model": model_name, "error": str(e)}
+    results.put(result)
+
+def run_model_in_subprocess(model_name, shm, num_samples):
+    """
+    在独立子进程中测试模型
+    子进程退出后模型权重和 PyTorch 缓存由系统完全回收，大模型不会叠加占用内存
+    返回: 测试结果（子进程异常退出时返回 None）
+    """
+    results = Queue()
+    proc = Process(target=_test_model_worker, args=(model_name, shm.name, num_samples, results))
+    proc.start()
+    
+    # 先取结果再 join（结果较大时子进程要等队列被读走才能退出）
+    result = None
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not proc.is_alive():
+                break
+    
+    proc.join()
+    return result
+
 def main():
     """主函数"""
     import argparse
@@ -153,7 +190,7 @@ def main():
         input("\n按 Enter 键开始录音...")
     
     # 录音
-    audio_data = record_audio(args.duration)
+    raw_audio, audio_data = record_audio(args.duration)
     
     # 保存音频文件（可选）
     print("\n💾 正在保存录音文件...")
@@ -162,21 +199,32 @@ def main():
         wf.setnchannels(CHANNELS)
         wf.setsampwidth(2)  # 16-bit
         wf.setframerate(SAMPLE_RATE)
-        audio_bytes = (audio_data * 32768).astype(np.int16).tobytes()
-        wf.writeframes(audio_bytes)
+        wf.writeframes(raw_audio)  # 直接写入原始 PCM，无需从 float32 转回
     print("✅ 录音已保存为: test_recording.wav")
     
-    # 测试所有模型
+    # 音频放入共享内存，子进程直接映射读取（无需序列化整段录音）
+    shm = shared_memory.SharedMemory(create=True, size=max(1, audio_data.nbytes))
+    shared_audio = np.ndarray(audio_data.shape, dtype=np.float32, buffer=shm.buf)
+    shared_audio[:] = audio_data
+    
+    # 测试所有模型（每个模型一个子进程）
     results = []
-    for idx, model_name in enumerate(models_to_test, 1):
-        print(f"\n{'='*60}")
-        print(f"📊 进度: {idx}/{len(models_to_test)}")
-        print(f"{'='*60}")
-        try:
-            result = test_model(model_name, audio_data)
-            results.append(result)
-        except Exception as e:
-            print(f"❌ 模型 {model_name} 测试失败: {e}")
+    try:
+        for idx, model_name in enumerate(models_to_test, 1):
+            print(f"\n{'='*60}")
+            print(f"📊 进度: {idx}/{len(models_to_test)}")
+            print(f"{'='*60}")
+            result = run_model_in_subprocess(model_name, shm, audio_data.size)
+            if result is None:
+                print(f"❌ 模型 {model_name} 测试失败: 子进程异常退出")
+            elif "error" in result:
+                print(f"❌ 模型 {model_name} 测试失败: {result['error']}")
+            else:
+                results.append(result)
+    finally:
+        del shared_audio
+        shm.close()
+        shm.unlink()
     
     # 汇总结果
     if len(results) > 1: